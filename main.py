@@ -1,279 +1,561 @@
-import os
-import requests
-import yfinance as yf
-import pandas as pd
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    BroadcastRequest,
-    TextMessage
-)
-import google.generativeai as genai
-
-# --- Configuration ---
-# ⚠️ Critical: Read tokens from environment variables for security
-LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN')
-# Use Backend-specific key if available, otherwise fallback to generic key
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY_BACKEND') or os.environ.get('GEMINI_API_KEY')
-
-# NEW: Keys for Stock/Crypto Data
-ALPHA_VANTAGE_KEY = os.environ.get('ALPHA_VANTAGE_KEY')
-FUGLE_KEY = os.environ.get('FUGLE_KEY')
-
-# Thresholds
-EXTREME_FEAR_THRESHOLD = 25
-FEAR_THRESHOLD = 44
-
-def format_price(price):
-    """Formats price: 8 decimals if < 1, else 0 decimals (or 2)"""
-    if price is None:
-        return "N/A"
-    if price < 1:
-        return f"{price:.8f}"
-    return f"{price:,.0f}"
-
-def fetch_crypto_sentiment():
-    """Fetches Crypto Fear & Greed Index from Alternative.me"""
-    try:
-        url = "https://api.alternative.me/fng/?limit=1"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        value = int(data['data'][0]['value'])
-        return value
-    except Exception as e:
-        print(f"Error fetching Crypto sentiment: {e}")
-        return None
-
-def fetch_us_stock_sentiment():
-    """Fetches US Stock Fear & Greed Index from CNN (or fallback)"""
-    # Note: CNN often blocks scraper. If AV API key is present, we could calculate RSI, but sticking to CNN for FNG value.
-    try:
-        url = "https://production.dataviz.cnn.io/index/fearandgreed/graphdata"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if 'fear_and_greed' in data:
-            score = int(round(data['fear_and_greed']['score']))
-            return score
-        return None
-    except Exception as e:
-        print(f"Error fetching US Stock sentiment: {e}")
-        return None
-
-def fetch_tw_stock_rsi(ticker="0050.TW"):
-    """Calculates RSI (14) for a TW stock using yfinance"""
-    try:
-        # Fetch 3 months of data to ensure enough for RSI calculation
-        df = yf.download(ticker, period="3mo", interval="1d", progress=False)
-        if df.empty or len(df) < 15:
-            return None
-        
-        # Calculate RSI
-        delta = df['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        
-        current_rsi = rsi.iloc[-1]
-        if isinstance(current_rsi, pd.Series):
-             current_rsi = current_rsi.iloc[0]
-
-        return int(round(current_rsi))
-    except Exception as e:
-        print(f"Error fetching TW Stock RSI: {e}")
-        return None
-
-def fetch_price_stats(ticker):
-    """Fetches current price and 1-year high/low"""
-    try:
-        ticker_obj = yf.Ticker(ticker)
-        hist = ticker_obj.history(period="1y")
-        if hist.empty:
-            return None
-        
-        current_price = hist['Close'].iloc[-1]
-        year_high = hist['Close'].max()
-        year_low = hist['Close'].min()
-        
-        return {
-            "current": current_price,
-            "high": year_high,
-            "low": year_low
-        }
-    except Exception as e:
-        print(f"Error fetching price stats for {ticker}: {e}")
-        return None
-
-def get_status_emoji(value):
-    if value <= EXTREME_FEAR_THRESHOLD:
-        return "🔴" # Extreme Fear
-    if value <= FEAR_THRESHOLD:
-        return "🟠" # Fear
-    return "🔵" # Neutral/Greed
-
-def get_status_text(value, is_rsi=False):
-    if value <= EXTREME_FEAR_THRESHOLD:
-        return "極度恐懼"
-    if value <= FEAR_THRESHOLD:
-        return "RSI偏低" if is_rsi else "恐懼"
-    return "安全/貪婪"
-
-def generate_ai_advice(market_status_list):
-    """Generates DCA advice using Gemini AI"""
-    if not GEMINI_API_KEY:
-        return "⚠️ AI 建議無法產生 (未設定 API Key)"
-
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        
-        prompt = f"""
-        你是一位極度穩健的 DCA (平均成本法) 投資顧問。你的核心策略是嚴格遵守「在市場情緒極度恐懼時才強力買入」的紀律。
-
-        請根據以下觸發的市場數據，提供一個**簡潔、明確**的操作建議 (50字以內)。
-
-        核心任務：
-        1. 分析當前的 FNG/RSI 數值所代表的市場情緒強度。
-        2. 根據情緒強度，結合資產名稱和當前價格，**相較於最近一年的價格波動 (參考最高/最低價)**，判斷現在的價格是否具有吸引力？(注意：小幣種價格可能包含多位小數)。
-        3. 根據以下行動邏輯，生成一段富有洞察力和鼓勵性的建議。
-
-        行動邏輯：
-        - 極度恐懼 (<= 25): 立即建議「強力分批買入」或「執行最大額度投入」。
-        - 恐懼 (26 - 44): 建議「小額分批買入」，鼓勵保持紀律。
-        - 中立 (45 - 55): 建議「維持觀望，不買也不賣」。
-        - 貪婪 (56 - 74) 極度貪婪 (>= 75):: 建議「停止買入，開始小額分批賣出 (止盈)」。
-
-        當前觸發的市場狀態:
-        {chr(10).join(market_status_list)}
-
-        根據以上資訊，你的行動建議是？
-        """
-        
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Error generating AI advice: {e}")
-        return "⚠️ AI 暫時無法提供建議"
-
-def main():
-    if not LINE_CHANNEL_ACCESS_TOKEN:
-        print("Error: LINE_CHANNEL_ACCESS_TOKEN not set.")
-        # return # Allow running locally without LINE token for debug
-
-    print("Fetching market data...")
-    crypto_fng = fetch_crypto_sentiment()
-    us_stock_fng = fetch_us_stock_sentiment()
-    tw_stock_rsi = fetch_tw_stock_rsi()
-
-    print(f"Crypto: {crypto_fng}")
-    print(f"US Stock: {us_stock_fng}")
-    print(f"TW Stock (RSI): {tw_stock_rsi}")
-
-    # Collect status for ALL markets
-    market_status_list = []
-    has_buy_signal = False
-    
-    # Crypto Logic
-    if crypto_fng is not None:
-        status_icon = get_status_emoji(crypto_fng)
-        status_text = get_status_text(crypto_fng)
-        msg = f"🪙 加密貨幣: {crypto_fng} ({status_text} {status_icon})"
-        
-        # Always fetch Price Stats for BTC and ETH
-        btc_stats = fetch_price_stats("BTC-USD")
-        if btc_stats:
-            msg += f"\n   - BTC: ${format_price(btc_stats['current'])} (1Y High: ${format_price(btc_stats['high'])}, Low: ${format_price(btc_stats['low'])})"
-            
-        eth_stats = fetch_price_stats("ETH-USD")
-        if eth_stats:
-            msg += f"\n   - ETH: ${format_price(eth_stats['current'])} (1Y High: ${format_price(eth_stats['high'])}, Low: ${format_price(eth_stats['low'])})"
-            
-        market_status_list.append(msg)
-        if crypto_fng <= FEAR_THRESHOLD:
-            has_buy_signal = True
-    
-    # US Stock Logic
-    if us_stock_fng is not None:
-        status_icon = get_status_emoji(us_stock_fng)
-        status_text = get_status_text(us_stock_fng)
-        msg = f"🇺🇸 美股: {us_stock_fng} ({status_text} {status_icon})"
-        
-        # Add SPY Stats
-        spy_stats = fetch_price_stats("SPY")
-        if spy_stats:
-             msg += f"\n   - SPY: ${format_price(spy_stats['current'])} (1Y High: ${format_price(spy_stats['high'])}, Low: ${format_price(spy_stats['low'])})"
-        
-        # Add Gold Stats (GLD)
-        gld_stats = fetch_price_stats("GLD")
-        if gld_stats:
-             msg += f"\n   - GOLD: ${format_price(gld_stats['current'])} (1Y High: ${format_price(gld_stats['high'])}, Low: ${format_price(gld_stats['low'])})"
-
-        market_status_list.append(msg)
-        if us_stock_fng <= FEAR_THRESHOLD:
-            has_buy_signal = True
-        
-    # TW Stock Logic
-    if tw_stock_rsi is not None:
-        status_icon = get_status_emoji(tw_stock_rsi)
-        status_text = get_status_text(tw_stock_rsi, is_rsi=True)
-        msg = f"🇹🇼 台股(0050): {tw_stock_rsi} ({status_text} {status_icon})"
-        
-        # Add 0050 Stats
-        tw50_stats = fetch_price_stats("0050.TW")
-        if tw50_stats:
-             msg += f"\n   - 0050: ${format_price(tw50_stats['current'])} (1Y High: ${format_price(tw50_stats['high'])}, Low: ${format_price(tw50_stats['low'])})"
-
-        market_status_list.append(msg)
-        if tw_stock_rsi <= FEAR_THRESHOLD:
-            has_buy_signal = True
-
-    # Determine Header
-    if has_buy_signal:
-        header = "🔥 Smart DCA 訊號觸發 🔥"
-    else:
-        header = "📊 每日市場觀察報告"
-
-    # Construct Message
-    message_text = f"{header}\n\n"
-    message_text += "\n\n".join(market_status_list)
-    
-    # Generate AI Advice (Always generate)
-    print("Generating AI advice...")
-    ai_advice = generate_ai_advice(market_status_list)
-    message_text += f"\n\n🤖 AI 投資顧問建議:\n{ai_advice}"
-    
-    if has_buy_signal:
-        message_text += "\n\n💡 建議分批進場"
-    else:
-        message_text += "\n\n💡 市場情緒穩定，請持續觀察"
-
-    print("Broadcasting LINE notification...")
-    if LINE_CHANNEL_ACCESS_TOKEN:
-        try:
-            configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
-            api_client = ApiClient(configuration)
-            messaging_api = MessagingApi(api_client)
-
-            # Broadcast Request
-            broadcast_request = BroadcastRequest(
-                messages=[TextMessage(text=message_text)]
-            )
-            
-            messaging_api.broadcast(broadcast_request)
-            print("Broadcast sent successfully!")
-
-        except Exception as e:
-            print(f"Error sending LINE notification: {e}")
-    else:
-        print("Skipped Broadcast (No Token)") # Friendly verify for local run
-
-if __name__ == "__main__":
-    main()
-
+import functools
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Numba is a nice-to-have: the RSI kernel compiles to machine code with it,
+# and falls back to a vectorized NumPy path without it.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+from tools.cache import FileCache
+
+# --- Configuration ---
+# ⚠️ Critical: Read tokens from environment variables for security
+LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN')
+# Use Backend-specific key if available, otherwise fallback to generic key
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY_BACKEND') or os.environ.get('GEMINI_API_KEY')
+
+# NEW: Keys for Stock/Crypto Data
+ALPHA_VANTAGE_KEY = os.environ.get('ALPHA_VANTAGE_KEY')
+FUGLE_KEY = os.environ.get('FUGLE_KEY')
+
+# Behaviour toggles, so deployment variants are configuration instead of
+# diverging copies of this script:
+#   MODE=push sends to LINE_USER_ID instead of broadcasting
+#   REPORT=triggers only sends when a buy signal fired
+#   INCLUDE_PRICE_STATS=0 drops the price lines (and their fetches)
+MODE = os.environ.get('MODE', 'broadcast')
+REPORT = os.environ.get('REPORT', 'always')
+INCLUDE_PRICE_STATS = os.environ.get('INCLUDE_PRICE_STATS', '1') != '0'
+LINE_USER_ID = os.environ.get('LINE_USER_ID')
+
+# Markets to monitor (e.g. SMARTDCA_MARKETS=crypto,us). A disabled market
+# skips its fetches entirely — handy for dodging Yahoo rate limits when
+# only the sentiment indexes matter. Tokens are stripped and lowercased
+# so "crypto, US" works; unknown names get a warning instead of silently
+# dropping a market from the report.
+_KNOWN_MARKETS = frozenset({'crypto', 'us', 'tw'})
+ENABLED_MARKETS = frozenset(
+    market.strip().lower()
+    for market in os.environ.get('SMARTDCA_MARKETS', 'crypto,us,tw').split(',')
+    if market.strip()
+)
+for _market in ENABLED_MARKETS - _KNOWN_MARKETS:
+    print(f"Warning: unknown market '{_market}' in SMARTDCA_MARKETS "
+          f"(expected: {', '.join(sorted(_KNOWN_MARKETS))})")
+
+# Thresholds
+EXTREME_FEAR_THRESHOLD = 25
+FEAR_THRESHOLD = 44
+
+# Disk cache so re-runs within the same day skip the network entirely.
+# Sentiment indexes move slowly intraday; daily bars don't change at all.
+# Lives under the user cache dir by default so it survives whatever the
+# current working directory happens to be; override with SMARTDCA_CACHE_DIR.
+_CACHE = FileCache(directory=os.environ.get(
+    'SMARTDCA_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'smartdca')
+))
+SENTIMENT_TTL = 6 * 3600
+HISTORY_TTL = 24 * 3600
+ADVICE_TTL = 12 * 3600
+
+# Every ticker we report on; fetch_price_history fans these out as
+# parallel per-ticker chart-API requests.
+PRICE_TICKERS = ("BTC-USD", "ETH-USD", "SPY", "GLD", "0050.TW")
+
+# Endpoint constants, built once instead of per call.
+_FNG_URL = "https://api.alternative.me/fng/?limit=1"
+_CNN_URL = "https://production.dataviz.cnn.io/index/fearandgreed/graphdata"
+_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
+_GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent"
+
+# The CNN graphdata payload is mostly historical series we never look at;
+# this pulls the single current score without materializing the full JSON.
+_CNN_SCORE_RE = re.compile(rb'"fear_and_greed"\s*:\s*\{[^}]*"score"\s*:\s*([0-9.]+)')
+
+# One shared Session: keep-alive skips repeat TCP/TLS handshakes, and the
+# retry policy absorbs transient 429/5xx instead of failing the whole run.
+_SESSION = requests.Session()
+# Default headers set once for every request: a browser-like UA (CNN and
+# Yahoo both reject the default python-requests agent) and compressed JSON
+# to keep the larger payloads small on the wire.
+_SESSION.headers.update({
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Encoding": "gzip, deflate",
+    "Accept": "application/json"
+})
+# Bounded retries are cheaper than a whole rerun, and the split
+# connect/read timeouts shed dead peers in ~3s instead of blocking 10s.
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET", "HEAD"])
+))
+REQUEST_TIMEOUT = (3.05, 6)  # (connect, read) seconds
+
+def format_price(price):
+    """Formats price: 8 decimals if < 1, else 0 decimals (or 2)"""
+    if price is None:
+        return "N/A"
+    if price < 1:
+        return f"{price:.8f}"
+    return f"{price:,.0f}"
+
+PriceStats = namedtuple('PriceStats', ['current', 'high', 'low'])
+
+@functools.lru_cache(maxsize=1)
+def fetch_crypto_sentiment():
+    """Fetches Crypto Fear & Greed Index from Alternative.me"""
+    cached = _CACHE.get("fng", "crypto", ttl_seconds=SENTIMENT_TTL)
+    if cached is not None:
+        return cached
+    try:
+        response = _SESSION.get(_FNG_URL, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        value = int(data['data'][0]['value'])
+        _CACHE.set("fng", "crypto", payload=value)
+        return value
+    except Exception as e:
+        print(f"Error fetching Crypto sentiment: {e}")
+        return None
+
+@functools.lru_cache(maxsize=1)
+def fetch_us_stock_sentiment():
+    """Fetches US Stock Fear & Greed Index from CNN (or fallback)"""
+    # Note: CNN often blocks scraper. If AV API key is present, we could calculate RSI, but sticking to CNN for FNG value.
+    cached = _CACHE.get("fng", "us", ttl_seconds=SENTIMENT_TTL)
+    if cached is not None:
+        return cached
+    try:
+        response = _SESSION.get(_CNN_URL, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        match = _CNN_SCORE_RE.search(response.content)
+        if match:
+            score = int(round(float(match.group(1))))
+        else:
+            # Fall back to a full decode in case CNN reshapes the payload.
+            data = orjson.loads(response.content)
+            if 'fear_and_greed' not in data:
+                return None
+            score = int(round(data['fear_and_greed']['score']))
+        _CACHE.set("fng", "us", payload=score)
+        return score
+    except Exception as e:
+        print(f"Error fetching US Stock sentiment: {e}")
+        return None
+
+def _rsi14_kernel(close):
+    """Wilder RSI(14) over a float64 close array, returning the last value.
+
+    Compiled by Numba when available (cache=True so the compiled kernel
+    survives cron restarts); a warm call costs microseconds.
+    """
+    n = close.shape[0]
+    gain = 0.0
+    loss = 0.0
+    for i in range(1, 15):
+        d = close[i] - close[i - 1]
+        if d > 0:
+            gain += d
+        else:
+            loss -= d
+    gain /= 14
+    loss /= 14
+    for i in range(15, n):
+        d = close[i] - close[i - 1]
+        g = d if d > 0 else 0.0
+        l = -d if d < 0 else 0.0
+        gain = (gain * 13 + g) / 14
+        loss = (loss * 13 + l) / 14
+    rs = gain / loss if loss > 0 else 1e12
+    return 100 - 100 / (1 + rs)
+
+def _rsi14_numpy(close):
+    """Wilder RSI(14) fallback for environments without Numba.
+
+    One vectorized pass splits gains and losses, then a short recurrence
+    applies Wilder smoothing — the same semantics as the jitted kernel,
+    so both paths report the same value.
+    """
+    delta = np.diff(close)
+    # (d + |d|)/2 and (|d| - d)/2 split gains/losses with arithmetic only,
+    # instead of two boolean-mask passes over delta.
+    abs_delta = np.abs(delta)
+    gain = (delta + abs_delta) * 0.5
+    loss = (abs_delta - delta) * 0.5
+    avg_gain = gain[:14].mean()
+    avg_loss = loss[:14].mean()
+    for g, l in zip(gain[14:], loss[14:]):
+        avg_gain = (avg_gain * 13 + g) / 14
+        avg_loss = (avg_loss * 13 + l) / 14
+    rs = avg_gain / avg_loss if avg_loss > 0 else 1e12
+    return 100 - 100 / (1 + rs)
+
+# fastmath is safe here: the recurrence has no NaN/inf-sensitive steps and
+# a sub-ulp difference cannot move the rounded 0-100 RSI.
+_rsi14 = njit(cache=True, fastmath=True)(_rsi14_kernel) if njit is not None else _rsi14_numpy
+
+if njit is not None:
+    # Warm the JIT on a dummy array at import: with cache=True this loads
+    # the compiled kernel from disk on repeat cron runs instead of paying
+    # the ~1s compile in the middle of the fetch phase.
+    try:
+        _rsi14(np.arange(30, dtype=np.float64))
+    except Exception:
+        pass
+
+def _fetch_chart_closes(ticker, chart_range="1y", interval="1d"):
+    """Fetches closes for one ticker from Yahoo's chart API"""
+    response = _SESSION.get(_CHART_URL.format(ticker=ticker),
+                            params={"range": chart_range, "interval": interval},
+                            timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    result = orjson.loads(response.content)['chart']['result'][0]
+    closes = result['indicators']['quote'][0]['close']
+    # Yahoo pads untraded days with nulls; drop them.
+    return [c for c in closes if c is not None]
+
+@functools.lru_cache(maxsize=32)
+def _get_chart_closes(ticker, chart_range="1y", interval="1d"):
+    """Cached wrapper around the chart API, keyed per ticker, range and day"""
+    # Bars are stable within a day, so key the cache on today's date.
+    key = ("history", ticker, chart_range, interval, date.today().isoformat())
+    cached = _CACHE.get(*key, ttl_seconds=HISTORY_TTL)
+    if cached is not None:
+        return cached
+    closes = _fetch_chart_closes(ticker, chart_range, interval)
+    if closes:
+        _CACHE.set(*key, payload=closes)
+    return closes
+
+def fetch_price_history(tickers=PRICE_TICKERS, chart_range="1y", interval="1d"):
+    """Fetches closes for the given tickers in parallel"""
+    closes = {}
+    with ThreadPoolExecutor(max_workers=len(tickers)) as executor:
+        futures = {ticker: executor.submit(_get_chart_closes, ticker, chart_range, interval)
+                   for ticker in tickers}
+        for ticker, future in futures.items():
+            try:
+                series = future.result()
+                if series:
+                    closes[ticker] = series
+            except Exception as e:
+                print(f"Error fetching chart data for {ticker}: {e}")
+    return closes
+
+def fetch_tw_stock_rsi(history, ticker="0050.TW"):
+    """Calculates RSI (14) for a TW stock from the batched close history"""
+    try:
+        closes = history.get(ticker)
+        # 14 deltas to seed plus at least one smoothed step.
+        if closes is None or len(closes) < 16:
+            return None
+
+        close = np.asarray(closes[-90:], dtype=np.float64)
+        return int(round(_rsi14(close)))
+    except Exception as e:
+        print(f"Error computing TW Stock RSI: {e}")
+        return None
+
+def fetch_price_stats(ticker, history):
+    """Computes current price and 1-year high/low from the batched history"""
+    closes = history.get(ticker)
+    if not closes:
+        return None
+
+    arr = np.asarray(closes, dtype=np.float64)
+    return PriceStats(
+        current=float(arr[-1]),
+        high=float(arr.max()),
+        low=float(arr.min())
+    )
+
+def gather_market_data():
+    """Runs the sentiment fetches concurrently and returns (crypto, us, history).
+
+    The fan-out is pure I/O, so a small thread pool already collapses wall
+    time to the slowest endpoint; the Gemini and LINE SDKs are blocking,
+    which is why this stays on threads instead of asyncio. Only the 0050
+    history is fetched here (for the RSI trigger); the remaining tickers
+    are only needed when the full report goes out.
+    """
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        # Only dispatch the markets that are enabled; a masked market costs
+        # zero network I/O and reads as None downstream.
+        crypto_future = (executor.submit(fetch_crypto_sentiment)
+                         if 'crypto' in ENABLED_MARKETS else None)
+        us_future = (executor.submit(fetch_us_stock_sentiment)
+                     if 'us' in ENABLED_MARKETS else None)
+        # RSI(14) only needs ~1 month of bars to seed Wilder smoothing.
+        tw_future = (executor.submit(fetch_price_history, ("0050.TW",), "1mo")
+                     if 'tw' in ENABLED_MARKETS else None)
+        # Each fetcher already catches its own exceptions and returns None/{}.
+        return (crypto_future.result() if crypto_future else None,
+                us_future.result() if us_future else None,
+                tw_future.result() if tw_future else {})
+
+# Status lookup tables covering every reading 0..100, bucketed once at
+# import time so the helpers are a single indexed load instead of branches.
+_STATUS_EMOJI = (("🔴",) * (EXTREME_FEAR_THRESHOLD + 1)       # Extreme Fear
+                 + ("🟠",) * (FEAR_THRESHOLD - EXTREME_FEAR_THRESHOLD)  # Fear
+                 + ("🔵",) * (100 - FEAR_THRESHOLD))          # Neutral/Greed
+_STATUS_TEXT = (("極度恐懼",) * (EXTREME_FEAR_THRESHOLD + 1)
+                + ("恐懼",) * (FEAR_THRESHOLD - EXTREME_FEAR_THRESHOLD)
+                + ("安全/貪婪",) * (100 - FEAR_THRESHOLD))
+_STATUS_TEXT_RSI = (("極度恐懼",) * (EXTREME_FEAR_THRESHOLD + 1)
+                    + ("RSI偏低",) * (FEAR_THRESHOLD - EXTREME_FEAR_THRESHOLD)
+                    + ("安全/貪婪",) * (100 - FEAR_THRESHOLD))
+
+@functools.lru_cache(maxsize=256)
+def classify(value, is_rsi=False):
+    """Returns (emoji, status text) for a reading; one clamp, two lookups.
+
+    Memoized so repeat readings share one result tuple instead of
+    allocating a fresh pair per call once the ticker count grows.
+    """
+    index = max(0, min(100, value))
+    table = _STATUS_TEXT_RSI if is_rsi else _STATUS_TEXT
+    return _STATUS_EMOJI[index], table[index]
+
+@functools.lru_cache(maxsize=1)
+def _line_messaging_api():
+    """Builds the LINE client once so repeat sends reuse its connection pool.
+
+    The SDK import stays inside the function so runs that never send a
+    message never pay for loading it.
+    """
+    from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
+    configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
+    return MessagingApi(ApiClient(configuration))
+
+# Fixed persona/rules for the AI advisor. Sent as the system instruction so
+# each call only carries the few dynamic market-state lines.
+SYSTEM_PROMPT = """
+你是一位極度穩健的 DCA (平均成本法) 投資顧問。你的核心策略是嚴格遵守「在市場情緒極度恐懼時才強力買入」的紀律。
+
+請根據觸發的市場數據，提供一個**簡潔、明確**的操作建議 (50字以內)。
+
+核心任務：
+1. 分析當前的 FNG/RSI 數值所代表的市場情緒強度。
+2. 根據情緒強度，結合資產名稱和當前價格，**相較於最近一年的價格波動 (參考最高/最低價)**，判斷現在的價格是否具有吸引力？(注意：小幣種價格可能包含多位小數)。
+3. 根據以下行動邏輯，生成一段富有洞察力和鼓勵性的建議。
+
+行動邏輯：
+- 極度恐懼 (<= 25): 立即建議「強力分批買入」或「執行最大額度投入」。
+- 恐懼 (26 - 44): 建議「小額分批買入」，鼓勵保持紀律。
+- 中立 (45 - 55): 建議「維持觀望，不買也不賣」。
+- 貪婪 (56 - 74) 極度貪婪 (>= 75):: 建議「停止買入，開始小額分批賣出 (止盈)」。
+"""
+
+def _advice_bucket(value):
+    """Rounds a 0-100 reading to the nearest 5 for the advice cache key,
+    so a 1-2 point day-to-day drift still reuses yesterday's advice."""
+    if value is None:
+        return "na"
+    return int(round(value / 5) * 5)
+
+def generate_ai_advice(market_status_list, crypto_fng=None, us_stock_fng=None, tw_stock_rsi=None,
+                       has_buy_signal=False):
+    """Generates DCA advice using Gemini AI"""
+    if not GEMINI_API_KEY:
+        return "⚠️ AI 建議無法產生 (未設定 API Key)"
+
+    # FNG/RSI move a point or two on most days; when the bucketed market
+    # state matches a recent run, reuse that advice and skip the LLM call.
+    # has_buy_signal is part of the key because a 5-point bucket can
+    # straddle FEAR_THRESHOLD — buy-side advice must never replay on a
+    # no-signal day.
+    key = ("advice", has_buy_signal, _advice_bucket(crypto_fng),
+           _advice_bucket(us_stock_fng), _advice_bucket(tw_stock_rsi))
+    cached = _CACHE.get(*key, ttl_seconds=ADVICE_TTL)
+    if cached is not None:
+        return cached
+
+    try:
+        prompt = f"當前觸發的市場狀態:\n{chr(10).join(market_status_list)}\n\n根據以上資訊，你的行動建議是？"
+
+        # The SDK drags in gRPC/protobuf for what is one small HTTP call;
+        # hit the REST endpoint through the shared Session instead.
+        response = _SESSION.post(
+            _GEMINI_URL,
+            params={"key": GEMINI_API_KEY},
+            json={
+                "systemInstruction": {"parts": [{"text": SYSTEM_PROMPT}]},
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": {"maxOutputTokens": 256}
+            },
+            timeout=(3.05, 20)
+        )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        advice = data['candidates'][0]['content']['parts'][0]['text'].strip()
+        _CACHE.set(*key, payload=advice)
+        return advice
+    except Exception as e:
+        print(f"Error generating AI advice: {e}")
+        return "⚠️ AI 暫時無法提供建議"
+
+def main():
+    if not LINE_CHANNEL_ACCESS_TOKEN:
+        print("Error: LINE_CHANNEL_ACCESS_TOKEN not set.")
+        # return # Allow running locally without LINE token for debug
+
+    print("Fetching market data...")
+    crypto_fng, us_stock_fng, tw_history = gather_market_data()
+
+    # RSI is a local computation on the fetched 0050 history.
+    tw_stock_rsi = fetch_tw_stock_rsi(tw_history)
+
+    print(f"Crypto: {crypto_fng}")
+    print(f"US Stock: {us_stock_fng}")
+    print(f"TW Stock (RSI): {tw_stock_rsi}")
+
+    # Decide up front whether any market triggers a buy; on quiet days we
+    # skip the price fan-out and the Gemini call entirely. Monday still
+    # gets the full weekly report with prices and advice.
+    has_buy_signal = any(
+        value is not None and value <= FEAR_THRESHOLD
+        for value in (crypto_fng, us_stock_fng, tw_stock_rsi)
+    )
+    if REPORT == 'triggers' and not has_buy_signal:
+        print("No buy signal; skipping report (REPORT=triggers).")
+        return
+
+    # Advice and price stats are independent axes: INCLUDE_PRICE_STATS=0
+    # drops only the price lines, not the Gemini call.
+    include_advice = has_buy_signal or date.today().weekday() == 0
+    include_details = include_advice and INCLUDE_PRICE_STATS
+    # 52 weekly bars pin down the 1Y high/low closely enough at ~1/5 the
+    # payload of daily bars.
+    history = fetch_price_history(interval="1wk") if include_details else {}
+
+    # Collect status for ALL markets
+    market_status_list = []
+
+    # Crypto Logic
+    if crypto_fng is not None:
+        status_icon, status_text = classify(crypto_fng)
+        msg = f"🪙 加密貨幣: {crypto_fng} ({status_text} {status_icon})"
+        
+        # Price Stats for BTC and ETH (sliced from the batched history)
+        btc_stats = fetch_price_stats("BTC-USD", history)
+        if btc_stats:
+            msg += f"\n   - BTC: ${format_price(btc_stats.current)} (1Y High: ${format_price(btc_stats.high)}, Low: ${format_price(btc_stats.low)})"
+
+        eth_stats = fetch_price_stats("ETH-USD", history)
+        if eth_stats:
+            msg += f"\n   - ETH: ${format_price(eth_stats.current)} (1Y High: ${format_price(eth_stats.high)}, Low: ${format_price(eth_stats.low)})"
+            
+        market_status_list.append(msg)
+
+    # US Stock Logic
+    if us_stock_fng is not None:
+        status_icon, status_text = classify(us_stock_fng)
+        msg = f"🇺🇸 美股: {us_stock_fng} ({status_text} {status_icon})"
+        
+        # Add SPY Stats
+        spy_stats = fetch_price_stats("SPY", history)
+        if spy_stats:
+             msg += f"\n   - SPY: ${format_price(spy_stats.current)} (1Y High: ${format_price(spy_stats.high)}, Low: ${format_price(spy_stats.low)})"
+        
+        # Add Gold Stats (GLD)
+        gld_stats = fetch_price_stats("GLD", history)
+        if gld_stats:
+             msg += f"\n   - GOLD: ${format_price(gld_stats.current)} (1Y High: ${format_price(gld_stats.high)}, Low: ${format_price(gld_stats.low)})"
+
+        market_status_list.append(msg)
+
+    # TW Stock Logic
+    if tw_stock_rsi is not None:
+        status_icon, status_text = classify(tw_stock_rsi, is_rsi=True)
+        msg = f"🇹🇼 台股(0050): {tw_stock_rsi} ({status_text} {status_icon})"
+        
+        # Add 0050 Stats
+        tw50_stats = fetch_price_stats("0050.TW", history)
+        if tw50_stats:
+             msg += f"\n   - 0050: ${format_price(tw50_stats.current)} (1Y High: ${format_price(tw50_stats.high)}, Low: ${format_price(tw50_stats.low)})"
+
+        market_status_list.append(msg)
+
+    # Determine Header
+    if has_buy_signal:
+        header = "🔥 Smart DCA 訊號觸發 🔥"
+    else:
+        header = "📊 每日市場觀察報告"
+
+    # Construct Message: collect the sections and join once at the end
+    # instead of growing the string with repeated concats.
+    sections = [header]
+    sections.extend(market_status_list)
+
+    # Generate AI Advice on signal days and Mondays, regardless of
+    # whether the price lines are included
+    if include_advice:
+        print("Generating AI advice...")
+        ai_advice = generate_ai_advice(market_status_list, crypto_fng, us_stock_fng, tw_stock_rsi,
+                                       has_buy_signal=has_buy_signal)
+        sections.append(f"🤖 AI 投資顧問建議:\n{ai_advice}")
+
+    if has_buy_signal:
+        sections.append("💡 建議分批進場")
+    else:
+        sections.append("💡 市場情緒穩定，請持續觀察")
+
+    message_text = "\n\n".join(sections)
+
+    print("Broadcasting LINE notification...")
+    if LINE_CHANNEL_ACCESS_TOKEN:
+        try:
+            # Imported here so runs that never send (no token, or
+            # REPORT=triggers with no signal) skip loading the SDK.
+            from linebot.v3.messaging import (
+                BroadcastRequest,
+                PushMessageRequest,
+                TextMessage
+            )
+
+            messaging_api = _line_messaging_api()
+
+            if MODE == 'push':
+                # Never fall back to broadcast here: a push deployment is
+                # private, and a missing LINE_USER_ID must not publish the
+                # report to every follower.
+                if not LINE_USER_ID:
+                    print("Error: MODE=push but LINE_USER_ID is not set; skipping send.")
+                    return
+                push_request = PushMessageRequest(
+                    to=LINE_USER_ID,
+                    messages=[TextMessage(text=message_text)]
+                )
+                messaging_api.push_message(push_request)
+                print("Push sent successfully!")
+            else:
+                broadcast_request = BroadcastRequest(
+                    messages=[TextMessage(text=message_text)]
+                )
+                messaging_api.broadcast(broadcast_request)
+                print("Broadcast sent successfully!")
+
+        except Exception as e:
+            print(f"Error sending LINE notification: {e}")
+    else:
+        print("Skipped Broadcast (No Token)") # Friendly verify for local run
+
+if __name__ == "__main__":
+    main()
+
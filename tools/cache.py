@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+import time
+
+# orjson decodes the larger history payloads a few times faster than the
+# stdlib; the cache still works without it.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FileCache:
+    """Tiny JSON file cache with a TTL.
+
+    Entries are keyed by arbitrary string parts (endpoint, ticker, date...),
+    hashed to a file under `directory`, and stored as {ts, payload} JSON.
+    Stale or unreadable entries simply behave like cache misses.
+    """
+
+    def __init__(self, directory=".cache", ttl_seconds=21600):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, key_parts):
+        key = "|".join(str(part) for part in key_parts)
+        digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, *key_parts, ttl_seconds=None):
+        """Returns the cached payload if fresher than the TTL, else None."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        try:
+            with open(self._path(key_parts), "rb") as f:
+                raw = f.read()
+            entry = orjson.loads(raw) if orjson is not None else json.loads(raw)
+            if time.time() - entry["ts"] < ttl:
+                return entry["payload"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def set(self, *key_parts, payload):
+        """Stores the payload, best-effort; writes atomically so readers
+        never see half a file, and an unwritable cache dir (read-only HOME,
+        locked-down container) is silently skipped rather than failing the
+        caller that just fetched the data."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key_parts)
+            tmp_path = path + ".tmp"
+            entry = {"ts": time.time(), "payload": payload}
+            raw = orjson.dumps(entry) if orjson is not None else json.dumps(entry).encode("utf-8")
+            with open(tmp_path, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            pass